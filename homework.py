@@ -1,10 +1,24 @@
+from http import HTTPStatus
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
+import random
+import signal
+import sys
+import threading
 import time
 
 from dotenv import load_dotenv
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import telegram
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import messagequeue as mq, Updater
+from telegram.ext.utils.promise import Promise
+from telegram.utils.request import Request
+from urllib3.util.retry import Retry
 
 
 class RequestFailedError(Exception):
@@ -19,18 +33,69 @@ class ApiAnswerError(Exception):
     pass
 
 
+class TooManyRequestsError(RequestFailedError):
+    """Превышен лимит запросов к API-сервису."""
+
+    def __init__(self, message, retry_after):
+        """Сохраняет время, через которое можно повторить запрос."""
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class MQBot(telegram.Bot):
+    """Бот, отправляющий сообщения через очередь с учётом лимитов Telegram."""
+
+    def __init__(self, *args, mqueue, **kwargs):
+        """Подключает к боту очередь сообщений."""
+        super().__init__(*args, **kwargs)
+        self._is_messages_queued_default = True
+        self._msg_queue = mqueue
+
+    @mq.queuedmessage
+    def send_message(self, *args, **kwargs):
+        """Ставит сообщение в очередь на отправку."""
+        return super().send_message(*args, **kwargs)
+
+
 load_dotenv()
 
 
 PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
-TOKENS = ['PRACTICUM_TOKEN', 'TELEGRAM_TOKEN', 'TELEGRAM_CHAT_ID']
 
 
 RETRY_TIME = 600
+MAX_RETRY_TIME = 3600
+RETRY_JITTER = 30
+MESSAGE_MAX_LENGTH = 4096
+MESSAGE_SEPARATOR = '\n\n'
+SEND_ATTEMPTS = 3
 ENDPOINT = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
 HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
+RETRY_STATUSES = [500, 502, 503, 504]
+REQUEST_TIMEOUT = (5, 30)
+MESSAGES_BURST_LIMIT = 29
+MESSAGES_TIME_LIMIT_MS = 1017
+CONNECTION_POOL_SIZE = 8
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+LOG_MAX_BYTES = 5_000_000
+LOG_BACKUP_COUNT = 3
+
+
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=2,
+    max_retries=Retry(
+        total=3,
+        read=False,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False,
+        respect_retry_after_header=False
+    )
+))
 
 
 VERDICTS = {
@@ -38,56 +103,120 @@ VERDICTS = {
     'reviewing': 'Работа взята на проверку ревьюером.',
     'rejected': 'Работа проверена: у ревьюера есть замечания.'
 }
+REQUIRED_KEYS = frozenset({'homework_name', 'status'})
+API_ERROR_KEYS = frozenset({'error', 'code'})
 
 
-MESSAGE_SENT_INFO = 'Сообщение "{message}" в Telegram отправлено.'
-SENDING_MESSAGE_ERROR = ('Не удалось отправить сообщение "{message}" '
-                         'в Telegram. - {error}')
+MESSAGE_SENT_INFO = 'Сообщение "%s" в Telegram отправлено.'
+SENDING_MESSAGE_ERROR = 'Не удалось отправить сообщение "%s" в Telegram. - %s'
+SENDING_RETRY_WARNING = ('Telegram ограничил отправку сообщения "%s", '
+                         'повтор через %s с.')
+SEND_ATTEMPTS_ERROR = 'Telegram ограничил отправку {attempts} раз подряд.'
 ERROR_MESSAGE = 'Сбой в работе программы: {error}.'
-API_ANSWER_ERROR = ('Ошибка при запросе к {url} с авторизацией {headers} '
-                    'и параметрами {params}: {error}.')
+API_ANSWER_ERROR = ('Ошибка при запросе к {url} '
+                    'с параметрами {params}: {error}.')
+API_TIMEOUT_ERROR = ('Превышено время ожидания ответа {timeout} от {url} '
+                     'с параметрами {params}: {error}.')
 API_RESPONSE_ERROR = 'Формат ответа API отличается от ожидаемого. {error}'
 RESPONSE_KEY_ERROR = 'Ответ API не содержит ключ "homeworks".'
+HOMEWORK_KEYS_ERROR = 'Информация о домашней работе не содержит ключи {keys}.'
 WRONG_STATUS_ERROR = ('Недокументированный статус домашней работы '
                       '{homework_name}: {status}.')
 STATUS_VERDICT = ('Изменился статус проверки работы "{homework_name}". '
                   '{verdict}')
-TOKENS_ERROR = 'Отсутствует переменная окружения {name}.'
+TOKENS_ERROR = 'Отсутствует переменная окружения %s.'
+
+
+def group_messages(messages):
+    """Собирает сообщения в группы, умещающиеся в одно сообщение Telegram."""
+    groups = []
+    length = MESSAGE_MAX_LENGTH
+    for message in messages:
+        length += len(MESSAGE_SEPARATOR) + len(message)
+        if length > MESSAGE_MAX_LENGTH:
+            groups.append([])
+            length = len(message)
+        groups[-1].append(message)
+    return groups
+
+
+def split_message(message):
+    """Разбивает текст на части не длиннее MESSAGE_MAX_LENGTH по абзацам."""
+    paragraphs = []
+    for paragraph in message.split(MESSAGE_SEPARATOR):
+        paragraphs.extend(
+            paragraph[start:start + MESSAGE_MAX_LENGTH]
+            for start in range(0, len(paragraph), MESSAGE_MAX_LENGTH)
+        )
+    return [
+        MESSAGE_SEPARATOR.join(group) for group in group_messages(paragraphs)
+    ]
 
 
 def send_message(bot, message):
     """Отправляет сообщение в Telegram чат."""
-    try:
-        bot.send_message(TELEGRAM_CHAT_ID, message)
-        logging.info(MESSAGE_SENT_INFO.format(message=message))
-        return True
-    except Exception as error:
-        logging.error(SENDING_MESSAGE_ERROR.format(
-            message=message, error=error
-        ))
-        return False
+    for chunk in split_message(message):
+        for _ in range(SEND_ATTEMPTS):
+            try:
+                sent = bot.send_message(TELEGRAM_CHAT_ID, chunk)
+                if isinstance(sent, Promise):
+                    sent.result()
+                break
+            except RetryAfter as error:
+                logging.warning(
+                    SENDING_RETRY_WARNING, chunk, error.retry_after
+                )
+                time.sleep(error.retry_after)
+            except TelegramError as error:
+                logging.error(SENDING_MESSAGE_ERROR, chunk, error)
+                return False
+        else:
+            logging.error(
+                SENDING_MESSAGE_ERROR, chunk,
+                SEND_ATTEMPTS_ERROR.format(attempts=SEND_ATTEMPTS)
+            )
+            return False
+    logging.info(MESSAGE_SENT_INFO, message)
+    return True
 
 
 def get_api_answer(current_timestamp):
     """Делает запрос к API-сервису."""
     params = {'from_date': current_timestamp}
-    request_params = dict(url=ENDPOINT, headers=HEADERS, params=params)
     try:
-        response = requests.get(**request_params)
+        response = SESSION.get(
+            ENDPOINT, headers=HEADERS, params=params, timeout=REQUEST_TIMEOUT
+        )
+    except requests.exceptions.Timeout as error:
+        raise ConnectionError(API_TIMEOUT_ERROR.format(
+            url=ENDPOINT, params=params, timeout=REQUEST_TIMEOUT, error=error
+        ))
     except requests.exceptions.RequestException as error:
         raise ConnectionError(API_ANSWER_ERROR.format(
-            error=error, **request_params
+            url=ENDPOINT, params=params, error=error
         ))
+    if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+        retry_after = response.headers.get('Retry-After', '')
+        raise TooManyRequestsError(
+            API_ANSWER_ERROR.format(
+                url=ENDPOINT, params=params, error=response.status_code
+            ),
+            int(retry_after) if retry_after.isdigit() else RETRY_TIME
+        )
     if response.status_code != 200:
         raise RequestFailedError(API_ANSWER_ERROR.format(
-            error=response.status_code, **request_params
+            url=ENDPOINT, params=params, error=response.status_code
+        ))
+    result = orjson.loads(response.content)
+    error_keys = (
+        API_ERROR_KEYS & result.keys() if isinstance(result, dict)
+        else set()
+    )
+    if error_keys:
+        raise ApiAnswerError(API_ANSWER_ERROR.format(
+            url=ENDPOINT, params=params,
+            error={key: result[key] for key in error_keys}
         ))
-    result = response.json()
-    for key in ['error', 'code']:
-        if key in result:
-            raise ApiAnswerError(API_ANSWER_ERROR.format(
-                error={key: result.get(key)}, **request_params
-            ))
     return result
 
 
@@ -107,6 +236,9 @@ def check_response(response):
 
 def parse_status(homework):
     """Извлекает из информации о домашней работе статус этой работы."""
+    missed_keys = REQUIRED_KEYS - homework.keys()
+    if missed_keys:
+        raise KeyError(HOMEWORK_KEYS_ERROR.format(keys=missed_keys))
     name = homework['homework_name']
     status = homework['status']
     if status not in VERDICTS:
@@ -120,46 +252,115 @@ def parse_status(homework):
 
 def check_tokens():
     """Проверяет доступность переменных окружения."""
-    missed_tokens = [name for name in TOKENS if globals()[name] is None]
+    tokens = (
+        ('PRACTICUM_TOKEN', PRACTICUM_TOKEN),
+        ('TELEGRAM_TOKEN', TELEGRAM_TOKEN),
+        ('TELEGRAM_CHAT_ID', TELEGRAM_CHAT_ID)
+    )
+    missed_tokens = [name for name, value in tokens if value is None]
     if missed_tokens:
-        logging.critical(TOKENS_ERROR.format(name=missed_tokens))
+        logging.critical(TOKENS_ERROR, missed_tokens)
     return not missed_tokens
 
 
+def check_homeworks(context):
+    """Опрашивает API-сервис и планирует следующий опрос."""
+    state = context.job.context
+    delay = RETRY_TIME
+    try:
+        response = get_api_answer(state['timestamp'])
+        homeworks = check_response(response)
+        changed = {}
+        for homework in homeworks or []:
+            message = parse_status(homework)
+            name = homework['homework_name']
+            if state['statuses'].get(name) != homework['status']:
+                changed[message] = homework
+        delivered = True
+        for group in group_messages(changed):
+            if not send_message(context.bot, MESSAGE_SEPARATOR.join(group)):
+                delivered = False
+                continue
+            state['statuses'].update(
+                (changed[verdict]['homework_name'], changed[verdict]['status'])
+                for verdict in group
+            )
+            state['errors'] = ''
+        if delivered:
+            state['timestamp'] = response.get(
+                'current_date', state['timestamp']
+            )
+        state['retry_time'] = RETRY_TIME
+    except Exception as error:
+        delay = min(state['retry_time'], MAX_RETRY_TIME) + random.uniform(
+            0, RETRY_JITTER
+        )
+        if isinstance(error, TooManyRequestsError):
+            delay = max(delay, error.retry_after)
+        state['retry_time'] = min(state['retry_time'] * 2, MAX_RETRY_TIME)
+        message = ERROR_MESSAGE.format(error=error)
+        logging.error(message)
+        if message != state['errors'] and send_message(context.bot, message):
+            state['errors'] = message
+    finally:
+        context.job_queue.run_once(check_homeworks, delay, context=state)
+
+
 def main():
     """Основная логика работы бота."""
     if not check_tokens():
-        raise ValueError
-    bot = telegram.Bot(token=TELEGRAM_TOKEN)
-    current_timestamp = int(time.time())
-    errors = ''
-    while True:
+        sys.exit(1)
+    message_queue = mq.MessageQueue(
+        all_burst_limit=MESSAGES_BURST_LIMIT,
+        all_time_limit_ms=MESSAGES_TIME_LIMIT_MS
+    )
+    try:
+        updater = Updater(bot=MQBot(
+            token=TELEGRAM_TOKEN,
+            request=Request(con_pool_size=CONNECTION_POOL_SIZE),
+            mqueue=message_queue
+        ))
+        updater.job_queue.run_once(check_homeworks, 0, context=dict(
+            timestamp=int(time.time()),
+            errors='',
+            statuses={},
+            retry_time=RETRY_TIME
+        ))
+        stop = threading.Event()
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, lambda signum, frame: stop.set())
+        updater.job_queue.start()
         try:
-            response = get_api_answer(current_timestamp)
-            homeworks = check_response(response)
-            current_timestamp = response.get(
-                'current_date', current_timestamp
-            )
-            if homeworks:
-                if send_message(bot, parse_status(homeworks[0])):
-                    errors = ''
-        except Exception as error:
-            message = ERROR_MESSAGE.format(error=error)
-            logging.error(message)
-            if message != errors and send_message(bot, message):
-                errors = message
-        time.sleep(RETRY_TIME)
+            stop.wait()
+        finally:
+            updater.job_queue.stop()
+    finally:
+        message_queue.stop()
 
 
 if __name__ == '__main__':
+    formatter = logging.Formatter(
+        '%(asctime)s, %(levelname)s, %(funcName)s, %(lineno)s, %(message)s'
+    )
+    handlers = [
+        RotatingFileHandler(
+            __file__ + '.log',
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT
+        ),
+        logging.StreamHandler()
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.Queue(-1)
     logging.basicConfig(
         level=logging.DEBUG,
-        format=('%(asctime)s, %(levelname)s, '
-                '%(funcName)s, %(lineno)s, %(message)s'),
-        handlers=[
-            logging.FileHandler((__file__ + '.log'), mode='w'),
-            logging.StreamHandler()
-        ]
+        format='%(message)s',
+        handlers=[QueueHandler(log_queue)]
     )
-
-    main()
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    try:
+        main()
+    finally:
+        listener.stop()
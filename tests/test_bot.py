@@ -1,8 +1,14 @@
+import http.client
+import io
+import json
 import os
+import threading
+import time
 from http import HTTPStatus
 
-import requests
 import telegram
+import telegram.ext
+import urllib3
 import utils
 
 
@@ -52,6 +58,38 @@ class MockResponseGET:
         }
         return data
 
+    @property
+    def content(self):
+        return json.dumps(self.json()).encode()
+
+
+def mock_raw_response(monkeypatch, http_status, *headers):
+    """Подменяет ответ сервера под urllib3 и возвращает список запросов."""
+    lines = [
+        f'HTTP/1.1 {http_status.value} {http_status.phrase}',
+        'Content-Length: 2',
+        *headers
+    ]
+    raw = ('\r\n'.join(lines) + '\r\n\r\n{}').encode()
+    calls = []
+
+    class MockSocket:
+        def makefile(self, *args, **kwargs):
+            return io.BytesIO(raw)
+
+    def mock_make_request(pool, conn, method, url, **kwargs):
+        calls.append(url)
+        response = http.client.HTTPResponse(MockSocket(), method=method)
+        response.begin()
+        return response
+
+    monkeypatch.setattr(
+        urllib3.connectionpool.HTTPConnectionPool,
+        '_make_request', mock_make_request
+    )
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    return calls
+
 
 class MockTelegramBot:
 
@@ -60,6 +98,7 @@ class MockTelegramBot:
             'Проверьте, что вы передали токен бота Telegram'
         )
         self.random_timestamp = random_timestamp
+        self.messages = []
 
     def send_message(self, chat_id=None, text=None, **kwargs):
         assert chat_id is not None, (
@@ -70,9 +109,33 @@ class MockTelegramBot:
             'Проверьте, что вы передали text= при отправке '
             'сообщения ботом Telegram'
         )
+        self.messages.append(text)
         return self.random_timestamp
 
 
+class MockJobQueue:
+
+    def __init__(self):
+        self.jobs = []
+
+    def run_once(self, callback, when, context=None, **kwargs):
+        self.jobs.append((callback, when, context))
+
+
+class MockJob:
+
+    def __init__(self, context):
+        self.context = context
+
+
+class MockCallbackContext:
+
+    def __init__(self, bot, state):
+        self.bot = bot
+        self.job = MockJob(state)
+        self.job_queue = MockJobQueue()
+
+
 class TestHomework:
     HOMEWORK_STATUSES = {
         'approved': 'Работа проверена: ревьюеру всё понравилось. Ура!',
@@ -186,10 +249,10 @@ class TestHomework:
                 current_timestamp=current_timestamp, **kwargs
             )
 
-        monkeypatch.setattr(requests, 'get', mock_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+
         func_name = 'get_api_answer'
         utils.check_function(homework, func_name, 1)
 
@@ -232,10 +295,10 @@ class TestHomework:
             response.json = json_invalid
             return response
 
-        monkeypatch.setattr(requests, 'get', mock_500_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_500_response_get)
+
         func_name = 'get_api_answer'
         try:
             homework.get_api_answer(current_timestamp)
@@ -315,10 +378,10 @@ class TestHomework:
             response.json = valid_response_json
             return response
 
-        monkeypatch.setattr(requests, 'get', mock_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+
         func_name = 'check_response'
         response = homework.get_api_answer(current_timestamp)
         status = homework.check_response(response)
@@ -352,10 +415,10 @@ class TestHomework:
             response.json = valid_response_json
             return response
 
-        monkeypatch.setattr(requests, 'get', mock_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+
         func_name = 'parse_status'
         response = homework.get_api_answer(current_timestamp)
         homeworks = homework.check_response(response)
@@ -400,10 +463,10 @@ class TestHomework:
             response.json = valid_response_json
             return response
 
-        monkeypatch.setattr(requests, 'get', mock_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+
         func_name = 'parse_status'
         response = homework.get_api_answer(current_timestamp)
         homeworks = homework.check_response(response)
@@ -448,10 +511,10 @@ class TestHomework:
             response.json = valid_response_json
             return response
 
-        monkeypatch.setattr(requests, 'get', mock_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+
         func_name = 'parse_status'
         response = homework.get_api_answer(current_timestamp)
         homeworks = homework.check_response(response)
@@ -484,10 +547,10 @@ class TestHomework:
             response.json = json_invalid
             return response
 
-        monkeypatch.setattr(requests, 'get', mock_no_homeworks_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_no_homeworks_response_get)
+
         func_name = 'check_response'
         result = homework.get_api_answer(current_timestamp)
         try:
@@ -525,10 +588,10 @@ class TestHomework:
             response.json = valid_response_json
             return response
 
-        monkeypatch.setattr(requests, 'get', mock_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+
         func_name = 'check_response'
         response = homework.get_api_answer(current_timestamp)
         try:
@@ -565,10 +628,10 @@ class TestHomework:
             response.json = valid_response_json
             return response
 
-        monkeypatch.setattr(requests, 'get', mock_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+
         func_name = 'check_response'
         response = homework.get_api_answer(current_timestamp)
         try:
@@ -599,10 +662,10 @@ class TestHomework:
             response.json = json_invalid
             return response
 
-        monkeypatch.setattr(requests, 'get', mock_empty_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_empty_response_get)
+
         func_name = 'check_response'
         result = homework.get_api_answer(current_timestamp)
         try:
@@ -626,10 +689,10 @@ class TestHomework:
             )
             return response
 
-        monkeypatch.setattr(requests, 'get', mock_response_get)
-
         import homework
 
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+
         func_name = 'check_response'
         try:
             homework.get_api_answer(current_timestamp)
@@ -640,3 +703,463 @@ class TestHomework:
                 f'Убедитесь, что в функции `{func_name}` обрабатываете ситуацию, '
                 'когда API возвращает код, отличный от 200'
             )
+
+    def test_session_returns_last_5xx_response(self, monkeypatch):
+        import homework
+
+        calls = mock_raw_response(monkeypatch, HTTPStatus.BAD_GATEWAY)
+        try:
+            homework.get_api_answer(0)
+        except homework.RequestFailedError:
+            pass
+        else:
+            assert False, (
+                'Убедитесь, что после исчерпания повторов ответ 5xx '
+                'обрабатывается в `get_api_answer` как `RequestFailedError`'
+            )
+        assert len(calls) > 1, (
+            'Убедитесь, что сессия повторяет запрос при ответе 5xx'
+        )
+
+    def test_session_does_not_retry_429(self, monkeypatch):
+        import homework
+
+        calls = mock_raw_response(
+            monkeypatch, HTTPStatus.TOO_MANY_REQUESTS, 'Retry-After: 120'
+        )
+        try:
+            homework.get_api_answer(0)
+        except homework.TooManyRequestsError:
+            pass
+        else:
+            assert False, (
+                'Убедитесь, что ответ 429 обрабатывается в `get_api_answer` '
+                'как `TooManyRequestsError`'
+            )
+        assert len(calls) == 1, (
+            'Убедитесь, что сессия не повторяет запрос при ответе 429'
+        )
+
+    def test_session_does_not_retry_read_timeout(self, monkeypatch):
+        import homework
+
+        calls = []
+
+        def mock_make_request(pool, conn, method, url, **kwargs):
+            calls.append(url)
+            raise urllib3.exceptions.ReadTimeoutError(pool, url, 'timeout')
+
+        monkeypatch.setattr(
+            urllib3.connectionpool.HTTPConnectionPool,
+            '_make_request', mock_make_request
+        )
+        try:
+            homework.get_api_answer(0)
+        except ConnectionError as error:
+            assert str(error).startswith('Превышено время ожидания'), (
+                'Убедитесь, что таймаут чтения обрабатывается в '
+                '`get_api_answer` как таймаут'
+            )
+        else:
+            assert False, (
+                'Убедитесь, что `get_api_answer` выбрасывает ошибку '
+                'при таймауте чтения'
+            )
+        assert len(calls) == 1, (
+            'Убедитесь, что сессия не повторяет запрос при таймауте чтения'
+        )
+
+    def test_check_homeworks_reschedules_after_failure(self, monkeypatch,
+                                                        random_timestamp,
+                                                        current_timestamp):
+        import homework
+
+        def mock_response_get(*args, **kwargs):
+            return MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                current_timestamp=current_timestamp,
+                http_status=HTTPStatus.INTERNAL_SERVER_ERROR, **kwargs
+            )
+
+        def mock_send_message(bot, message):
+            raise AttributeError('send_message')
+
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+        monkeypatch.setattr(homework, 'send_message', mock_send_message)
+        state = dict(
+            timestamp=current_timestamp, errors='', statuses={},
+            retry_time=homework.RETRY_TIME
+        )
+        context = MockCallbackContext(MockTelegramBot(token='token'), state)
+        try:
+            homework.check_homeworks(context)
+        except AttributeError:
+            pass
+        assert len(context.job_queue.jobs) == 1, (
+            'Убедитесь, что следующий опрос планируется, даже если '
+            'обработка ошибки завершилась исключением'
+        )
+
+    def test_check_homeworks_skips_unchanged_status(self, monkeypatch,
+                                                    current_timestamp):
+        import homework
+
+        def mock_response_get(*args, **kwargs):
+            response = MockResponseGET(
+                *args, current_timestamp=current_timestamp, **kwargs
+            )
+
+            def valid_response_json():
+                data = {
+                    "homeworks": [
+                        {
+                            'homework_name': 'hw123',
+                            'status': 'reviewing'
+                        }
+                    ],
+                    "current_date": current_timestamp
+                }
+                return data
+
+            response.json = valid_response_json
+            return response
+
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 12345)
+        bot = MockTelegramBot(token='token')
+        state = dict(
+            timestamp=current_timestamp, errors='', statuses={},
+            retry_time=homework.RETRY_TIME
+        )
+        for _ in range(2):
+            homework.check_homeworks(MockCallbackContext(bot, state))
+        assert len(bot.messages) == 1, (
+            'Убедитесь, что при неизменном статусе домашней работы '
+            'повторное сообщение в Telegram не отправляется'
+        )
+        assert state['statuses'] == {'hw123': 'reviewing'}, (
+            'Убедитесь, что после отправки сообщения запоминается '
+            'статус домашней работы'
+        )
+
+    def test_check_homeworks_batches_changed_statuses(self, monkeypatch,
+                                                      current_timestamp):
+        import homework
+
+        names = [f'hw{number}' + 'x' * 1500 for number in range(5)]
+
+        def mock_response_get(*args, **kwargs):
+            response = MockResponseGET(
+                *args, current_timestamp=current_timestamp, **kwargs
+            )
+
+            def valid_response_json():
+                data = {
+                    "homeworks": [
+                        {'homework_name': name, 'status': 'approved'}
+                        for name in names
+                    ],
+                    "current_date": current_timestamp
+                }
+                return data
+
+            response.json = valid_response_json
+            return response
+
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 12345)
+        bot = MockTelegramBot(token='token')
+        state = dict(
+            timestamp=current_timestamp, errors='', statuses={},
+            retry_time=homework.RETRY_TIME
+        )
+        homework.check_homeworks(MockCallbackContext(bot, state))
+        assert len(bot.messages) < len(names), (
+            'Убедитесь, что изменения статусов нескольких домашних работ '
+            'объединяются в одно сообщение'
+        )
+        verdicts = []
+        for message in bot.messages:
+            assert len(message) <= homework.MESSAGE_MAX_LENGTH, (
+                'Убедитесь, что сообщение не превышает ограничение Telegram'
+            )
+            verdicts.extend(message.split('\n\n'))
+        assert verdicts == [
+            homework.parse_status({'homework_name': name, 'status': 'approved'})
+            for name in names
+        ], (
+            'Убедитесь, что сообщения разбиваются только между вердиктами'
+        )
+        assert len(state['statuses']) == len(names), (
+            'Убедитесь, что после отправки запоминаются статусы '
+            'всех домашних работ'
+        )
+
+        class FailingTelegramBot(MockTelegramBot):
+
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                if self.messages:
+                    raise telegram.error.NetworkError('send_message')
+                return super().send_message(chat_id, text, **kwargs)
+
+        bot = FailingTelegramBot(token='token')
+        state['statuses'] = {}
+        homework.check_homeworks(MockCallbackContext(bot, state))
+        sent_verdicts = bot.messages[0].split('\n\n')
+        assert len(state['statuses']) == len(sent_verdicts), (
+            'Убедитесь, что запоминаются статусы только из тех '
+            'сообщений, которые удалось отправить'
+        )
+
+    def test_get_429_api_answer(self, monkeypatch, random_timestamp,
+                                current_timestamp):
+        import homework
+
+        def mock_429_response_get(*args, **kwargs):
+            response = MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                current_timestamp=current_timestamp,
+                http_status=HTTPStatus.TOO_MANY_REQUESTS, **kwargs
+            )
+            response.headers = {'Retry-After': '120'}
+            return response
+
+        monkeypatch.setattr(homework.SESSION, 'get', mock_429_response_get)
+        try:
+            homework.get_api_answer(current_timestamp)
+        except homework.TooManyRequestsError as error:
+            assert error.retry_after == 120, (
+                'Убедитесь, что `TooManyRequestsError` хранит значение '
+                'заголовка `Retry-After`'
+            )
+        else:
+            assert False, (
+                'Убедитесь, что `get_api_answer` выбрасывает '
+                '`TooManyRequestsError` при ответе 429'
+            )
+
+    def test_get_api_answer_error_keys(self, monkeypatch, random_timestamp,
+                                       current_timestamp):
+        import homework
+
+        def mock_response_get(*args, **kwargs):
+            response = MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                current_timestamp=current_timestamp, **kwargs
+            )
+
+            def error_response_json():
+                data = {
+                    "code": "UnknownError",
+                    "error": {"error": "Wrong from_date format"}
+                }
+                return data
+
+            response.json = error_response_json
+            return response
+
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+        try:
+            homework.get_api_answer(current_timestamp)
+        except homework.ApiAnswerError as error:
+            for key in ['code', 'error']:
+                assert f"'{key}'" in str(error), (
+                    'Убедитесь, что `get_api_answer` сообщает обо всех '
+                    f'ключах ошибки в ответе API, включая `{key}`'
+                )
+        else:
+            assert False, (
+                'Убедитесь, что `get_api_answer` выбрасывает ошибку, '
+                'если ответ API содержит ключи `error` или `code`'
+            )
+
+    def test_parse_status_lists_missing_keys(self):
+        import homework
+
+        try:
+            homework.parse_status({})
+        except KeyError as error:
+            for key in ['homework_name', 'status']:
+                assert key in str(error), (
+                    'Убедитесь, что `parse_status` сообщает обо всех '
+                    f'отсутствующих ключах, включая `{key}`'
+                )
+        else:
+            assert False, (
+                'Убедитесь, что `parse_status` выбрасывает `KeyError` '
+                'при отсутствии ключей домашней работы'
+            )
+
+    def test_send_message_telegram_error(self, monkeypatch):
+        import homework
+
+        class FailingTelegramBot(MockTelegramBot):
+
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                raise telegram.error.NetworkError('send_message')
+
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 12345)
+        assert not homework.send_message(
+            FailingTelegramBot(token='token'), 'message'
+        ), (
+            'Убедитесь, что `send_message` возвращает False, '
+            'если Telegram вернул ошибку'
+        )
+
+    def test_send_message_retry_after(self, monkeypatch):
+        import homework
+
+        class ThrottledTelegramBot(MockTelegramBot):
+
+            def __init__(self, *args, throttled_calls=(), **kwargs):
+                super().__init__(*args, **kwargs)
+                self.calls = 0
+                self.throttled_calls = throttled_calls
+
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                self.calls += 1
+                if self.calls in self.throttled_calls:
+                    raise telegram.error.RetryAfter(1)
+                return super().send_message(chat_id, text, **kwargs)
+
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 12345)
+        monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+        paragraphs = ['a' * 3000, 'b' * 3000]
+        bot = ThrottledTelegramBot(token='token', throttled_calls=(2,))
+        assert homework.send_message(bot, '\n\n'.join(paragraphs)), (
+            'Убедитесь, что `send_message` повторяет отправку после '
+            '`RetryAfter`'
+        )
+        assert bot.messages == paragraphs, (
+            'Убедитесь, что после `RetryAfter` повторно отправляется '
+            'только часть сообщения, которую Telegram не принял'
+        )
+
+        bot = ThrottledTelegramBot(
+            token='token',
+            throttled_calls=range(1, homework.SEND_ATTEMPTS + 2)
+        )
+        assert not homework.send_message(bot, 'message'), (
+            'Убедитесь, что `send_message` возвращает False, '
+            'если Telegram постоянно ограничивает отправку'
+        )
+        assert bot.calls == homework.SEND_ATTEMPTS, (
+            'Убедитесь, что число повторов отправки ограничено'
+        )
+
+    def test_api_error_hides_authorization(self, monkeypatch,
+                                           random_timestamp,
+                                           current_timestamp):
+        import homework
+
+        def mock_500_response_get(*args, **kwargs):
+            return MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                current_timestamp=current_timestamp,
+                http_status=HTTPStatus.INTERNAL_SERVER_ERROR, **kwargs
+            )
+
+        monkeypatch.setattr(homework.SESSION, 'get', mock_500_response_get)
+        try:
+            homework.get_api_answer(current_timestamp)
+        except homework.RequestFailedError as error:
+            assert homework.HEADERS['Authorization'] not in str(error), (
+                'Убедитесь, что сообщение об ошибке запроса не содержит '
+                'токен авторизации'
+            )
+        else:
+            assert False, (
+                'Убедитесь, что `get_api_answer` выбрасывает ошибку, '
+                'когда API возвращает код, отличный от 200'
+            )
+
+    def test_check_homeworks_resends_failed_group(self, monkeypatch,
+                                                  random_timestamp,
+                                                  current_timestamp):
+        import homework
+
+        names = [f'hw{number}' + 'x' * 1500 for number in range(5)]
+
+        def mock_response_get(*args, **kwargs):
+            response = MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                current_timestamp=current_timestamp, **kwargs
+            )
+
+            def valid_response_json():
+                data = {
+                    "homeworks": [
+                        {'homework_name': name, 'status': 'approved'}
+                        for name in names
+                    ],
+                    "current_date": random_timestamp
+                }
+                return data
+
+            response.json = valid_response_json
+            return response
+
+        class FailingTelegramBot(MockTelegramBot):
+
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                if self.messages:
+                    raise telegram.error.NetworkError('send_message')
+                return super().send_message(chat_id, text, **kwargs)
+
+        monkeypatch.setattr(homework.SESSION, 'get', mock_response_get)
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 12345)
+        state = dict(
+            timestamp=current_timestamp, errors='', statuses={},
+            retry_time=homework.RETRY_TIME
+        )
+        failing_bot = FailingTelegramBot(token='token')
+        homework.check_homeworks(MockCallbackContext(failing_bot, state))
+        assert state['timestamp'] == current_timestamp, (
+            'Убедитесь, что `from_date` не сдвигается, пока не отправлены '
+            'все сообщения об изменении статусов'
+        )
+        delivered = failing_bot.messages[0].split('\n\n')
+
+        bot = MockTelegramBot(token='token')
+        homework.check_homeworks(MockCallbackContext(bot, state))
+        resent = [
+            verdict for message in bot.messages
+            for verdict in message.split('\n\n')
+        ]
+        assert delivered + resent == [
+            homework.parse_status({'homework_name': name, 'status': 'approved'})
+            for name in names
+        ], (
+            'Убедитесь, что на следующем опросе повторно отправляются '
+            'только неотправленные вердикты'
+        )
+        assert state['timestamp'] == random_timestamp, (
+            'Убедитесь, что после отправки всех сообщений `from_date` '
+            'сдвигается на `current_date` из ответа API'
+        )
+
+    def test_main_stops_message_queue_on_error(self, monkeypatch):
+        import homework
+
+        monkeypatch.setattr(homework, 'PRACTICUM_TOKEN', 'sometoken')
+        monkeypatch.setattr(homework, 'TELEGRAM_TOKEN', 'bad')
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 12345)
+        try:
+            homework.main()
+        except telegram.error.InvalidToken:
+            pass
+        else:
+            assert False, (
+                'Убедитесь, что `main` не запускает бота с неверным токеном'
+            )
+        delay_queues = [
+            thread for thread in threading.enumerate()
+            if isinstance(thread, telegram.ext.messagequeue.DelayQueue)
+            and thread.is_alive()
+        ]
+        for delay_queue in delay_queues:
+            delay_queue.stop()
+        assert not delay_queues, (
+            'Убедитесь, что `main` останавливает очередь сообщений, '
+            'если запуск бота завершился ошибкой'
+        )